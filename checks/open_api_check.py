@@ -15,65 +15,138 @@
 """
 Simple checker for OpenAPI specification files.
 
-usage: open_api_check.py [-h] [-v] [-n] [-d DIRECTORY]
+Non-empty description (ie. containing not just whitespaces) is required for:
+  - the whole file (`info` node)
+  - each HTTP method of each path (`paths.*.*`)
+  - each method parameter (`paths.*.*.parameters[*]`)
+  - each method response (`paths.*.*.responses.*`)
+
+usage: open_api_check.py [-h] [-v] [-n] [-f] [-d DIRECTORY [DIRECTORY ...]]
 
 optional arguments:
   -h, --help            show this help message and exit
   -v, --verbose         make it verbose
   -n, --no-colors       disable color output
-  -d DIRECTORY, --directory DIRECTORY
-                        directory OpenAPI JSON file to check
+  -f, --fail-fast       stop checking after first problem is found
+  -d DIRECTORY [DIRECTORY ...], --directory DIRECTORY [DIRECTORY ...]
+                        directories with OpenAPI JSON file to check
+
+The checker is pure Python code walking dictionaries, so it can be run under
+PyPy without any change. Alternatively, thanks to type annotations, it can be
+compiled into C extension by mypyc:
+
+  mypyc checks/open_api_check.py
+  python -c "import open_api_check; open_api_check.main()" -d DIRECTORY
 """
 
 # Link to generated documentation for this script:
 # <https://redhatinsights.github.io/insights-results-aggregator-utils/packages/open_api_check.html>
 
 from pathlib import Path
-from json import load
-from sys import exit
-from os import popen
+from sys import exit, stdout
+from functools import lru_cache
+from itertools import chain
 from argparse import ArgumentParser
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
 import os
-
-
-def read_control_code(operation):
-    """Try to execute tput to read control code for selected operation."""
-    return popen("tput " + operation, "r").readline()
-
-
-def empty_attribute(node, selector):
-    """Test if the given attribute (of dictionary) is empty after stripping whitespaces."""
-    return node[selector].strip() == ""
-
-
-def check_info_node(obj, verbose):
+import curses
+import ijson  # type: ignore
+
+
+@lru_cache(maxsize=None)
+def setup_terminal() -> bool:
+    """Initialize terminal just once, return True if it can be used for colors."""
+    try:
+        curses.setupterm()
+        return True
+    except (curses.error, OSError, ValueError):
+        # Terminal can't be set up (unknown or no terminal, or standard output
+        # that is not a real file).
+        return False
+
+
+@lru_cache(maxsize=None)
+def read_control_code(operation: str) -> str:
+    """Try to read control code for selected operation from terminfo database."""
+    # Operation is specified the same way as for `tput` command, ie. terminal
+    # capability name followed by its numeric parameters. Control codes are
+    # read in-process (no `tput` is started) and are constant for given
+    # terminal, so the result is cached.
+    if not setup_terminal():
+        # No control code can be used.
+        return ""
+
+    capability, *parameters = operation.split()
+    try:
+        code = curses.tigetstr(capability)
+        if code is None:
+            # Terminal does not support selected capability.
+            return ""
+        return curses.tparm(code, *map(int, parameters)).decode("ascii")
+    except curses.error:
+        # Control code can't be constructed for this terminal.
+        return ""
+
+
+def read_info_node(fin: BinaryIO) -> Optional[Dict[str, Any]]:
+    """Read info node from OpenAPI JSON file, checking the syntax of the whole file."""
+    # The whole file is parsed, but just the info node is constructed (events
+    # are filtered by the parser itself, not in Python code). Thanks to this,
+    # syntax errors are detected before any content checks are performed,
+    # without materializing all paths in memory. Numbers are not checked at
+    # all, so they are decoded as plain floats rather than (much slower)
+    # Decimal objects.
+    items = ijson.items(fin, "info", use_float=True)
+    info = next(items, None)
+
+    # Read the rest of file to check its syntax.
+    for _ in items:
+        pass
+
+    return info
+
+
+def read_paths(fin: BinaryIO) -> Optional[Iterable[Tuple[str, Dict[str, Any]]]]:
+    """Stream all paths from OpenAPI JSON file, return None if paths node is missing."""
+    fin.seek(0)
+    paths = ijson.kvitems(fin, "paths", use_float=True)
+    first = next(paths, None)
+    if first is not None:
+        return chain([first], paths)
+
+    # No path has been found, so it is needed to distinguish between empty and
+    # missing paths node. It is a rare case, so the file is simply read again.
+    fin.seek(0)
+    if next(ijson.items(fin, "paths", use_float=True), None) is None:
+        return None
+
+    # Paths node exists, but it is empty.
+    return ()
+
+
+def check_info_node(info: Optional[Dict[str, Any]], verbose: Optional[bool],
+                    report: Callable[[str], None]) -> int:
     """Check the description in info node."""
     if verbose is not None:
         print("    checking info node")
 
-    # Make sure we have the object (payload) deserialized.
-    if obj is None:
-        print("Empty object has been deserialized")
-        return 1
-
     # Info node (with all attributes) are expected to be part of OpenAPI JSON file.
-    if "info" not in obj:
-        print("Info node can't be found")
+    if info is None:
+        report("Info node can't be found")
         # Value to be added into error accumulator (new error has been found).
         return 1
 
-    # Now it is possible to read info node.
-    info = obj["info"]
+    description = info.get("description")
 
     # Check if description attribute exists.
-    if "description" not in info:
-        print("No description provided for the whole file")
+    if description is None:
+        report("No description provided for the whole file")
         # Value to be added into error accumulator (new error has been found).
         return 1
 
-    # Check if description attribute contains any text.
-    if empty_attribute(info, "description"):
-        print("Empty description provided for the whole file")
+    # Check if description attribute contains any text (not just whitespaces).
+    if not description or description.isspace():
+        report("Empty description provided for the whole file")
         # Value to be added into error accumulator (new error has been found).
         return 1
 
@@ -81,123 +154,87 @@ def check_info_node(obj, verbose):
     return 0
 
 
-def check_description_for_method(path, method, m):
-    """Check if description is provided for a method (endpoint + HTTP method)."""
-    # Check if description attribute exists.
-    if "description" not in m:
-        print("            No description found for endpoint `" +
-              path + "` and method `" + method + "`")
-        # Value to be added into error accumulator (new error has been found).
-        return 1
+def check_path(path: str, methods: Dict[str, Any], verbose: Optional[bool],
+               report: Callable[[str], None], fail_fast: Optional[bool]) -> int:
+    """Check descriptions of all methods, their parameters, and responses for given path."""
+    # Error accumulator.
+    failures = 0
 
-    # Check if description attribute contains any text.
-    elif empty_attribute(m, "description"):
-        print("            Empty description found for endpoint `" +
-              path + "` and method `" + method + "`")
-        # Value to be added into error accumulator (new error has been found).
-        return 1
+    if verbose is not None:
+        print("    checking path " + path)
 
-    # Value to be added into error accumulator (no new errors).
-    return 0
+    # Perform error checks for all methods found in the OpenAPI file. All
+    # checks are done directly in this loop to walk each method node just
+    # once, without additional function calls.
+    for method, m in methods.items():
+        if verbose is not None:
+            print("        checking method " + method)
 
+        description = m.get("description")
 
-def check_description_for_method_parameters(path, method, m):
-    """Check if description is provided for all method parameters."""
-    # Error accumulator.
-    failures = 0
+        # Check if description attribute exists.
+        if description is None:
+            report("            No description found for endpoint `" +
+                   path + "` and method `" + method + "`")
+            # Increase number of errors found.
+            failures += 1
 
-    if "parameters" in m:
-        parameters = m["parameters"]
+        # Check if description attribute contains any text (not just whitespaces).
+        elif not description or description.isspace():
+            report("            Empty description found for endpoint `" +
+                   path + "` and method `" + method + "`")
+            # Increase number of errors found.
+            failures += 1
 
-        # Check all parameters.
-        for parameter in parameters:
+        # Part of error messages that is common for all method parameters and
+        # responses, so it is constructed just once.
+        endpoint = "endpoint `{}` method `{}`".format(path, method)
+
+        # Check all parameters (if any).
+        for parameter in m.get("parameters", ()):
+            description = parameter.get("description")
 
             # Check if description attribute exists.
-            if "description" not in parameter:
-                print("            No description found for endpoint `" +
-                      path + "` method `" + method + "` and parameter `" +
-                      parameter["name"] + "`")
+            if description is None:
+                report("            No description found for {} and parameter `{}`".format(
+                       endpoint, parameter["name"]))
                 # Increase number of errors found.
                 failures += 1
-            # Check if description attribute contains any text.
-            elif empty_attribute(parameter, "description"):
-                print("            Empty description found for endpoint `" +
-                      path + "` method `" + method + "` and parameter `" +
-                      parameter["name"] + "`")
+            # Check if description attribute contains any text (not just whitespaces).
+            elif not description or description.isspace():
+                report("            Empty description found for {} and parameter `{}`".format(
+                       endpoint, parameter["name"]))
                 # Increase number of errors found.
                 failures += 1
 
-    # Return errors count for this particular check.
-    return failures
-
-
-def check_description_for_method_responses(path, method, m):
-    """Check if description is provided for all method responses."""
-    # Error accumulator.
-    failures = 0
-
-    if "responses" in m:
-        responses = m["responses"]
+        # Check all responses (if any).
+        for response, r in m.get("responses", {}).items():
+            description = r.get("description")
 
-        # Check all responses.
-        for response in responses:
-            r = responses[response]
             # Check if description attribute exists.
-            if "description" not in r:
-                print("            No description found for endpoint `" +
-                      path + "` method `" + method +
-                      "` and response `" + response + "`")
+            if description is None:
+                report("            No description found for {} and response `{}`".format(
+                       endpoint, response))
                 # Increase number of errors found.
                 failures += 1
-            # Check if description attribute contains any text.
-            elif empty_attribute(r, "description"):
-                print("            Empty description found for endpoint `" +
-                      path + "` method `" + method +
-                      "` and response `" + response + "`")
+            # Check if description attribute contains any text (not just whitespaces).
+            elif not description or description.isspace():
+                report("            Empty description found for {} and response `{}`".format(
+                       endpoint, response))
                 # Increase number of errors found.
                 failures += 1
 
-    # Return errors count for this particular check.
-    return failures
-
-
-def check_method(path, method, methods, verbose):
-    """Check the content of HTTP method description."""
-    # Error accumulator.
-    failures = 0
-
-    if verbose is not None:
-        print("        checking method " + method)
-
-    m = methods[method]
-
-    # Perform particular error checks.
-    failures += check_description_for_method(path, method, m)
-    failures += check_description_for_method_parameters(path, method, m)
-    failures += check_description_for_method_responses(path, method, m)
-
-    # Return errors count for this particular check.
-    return failures
-
-
-def check_path(path, methods, verbose):
-    """Check descriptions etc. for given path in OpenAPI file."""
-    # Error accumulator.
-    failures = 0
-
-    if verbose is not None:
-        print("    checking path " + path)
-
-    # Perform error checks for all methods found in the OpenAPI file.
-    for method in methods:
-        # Increase number of errors found.
-        failures += check_method(path, method, methods, verbose)
+        # In fail fast mode, other methods are not checked at all.
+        if fail_fast and failures > 0:
+            break
 
     # Return errors count for this particular check.
     return failures
 
 
-def check_all_paths(obj, verbose):
+def check_all_paths(paths: Optional[Iterable[Tuple[str, Dict[str, Any]]]],
+                    verbose: Optional[bool], report: Callable[[str], None],
+                    fail_fast: Optional[bool]) -> int:
     """Check all paths for given path in OpenAPI file."""
     # Error accumulator.
     failures = 0
@@ -205,42 +242,77 @@ def check_all_paths(obj, verbose):
     if verbose is not None:
         print("    checking all paths found in OpenAPI file")
 
-    paths = obj["paths"]
-    # Perform error checks for all paths found in the OpenAPI file.
-    for path in paths:
-        methods = paths[path]
+    # Paths node is expected to be part of OpenAPI JSON file (but it might
+    # be empty).
+    if paths is None:
+        report("Paths node can't be found")
+        # Value to be added into error accumulator (new error has been found).
+        return 1
+
+    # Perform error checks for all paths found in the OpenAPI file. Paths are
+    # read as (path, methods) pairs from the stream, one at a time.
+    for path, methods in paths:
         # Increase number of errors found.
-        failures += check_path(path, methods, verbose)
+        failures += check_path(path, methods, verbose, report, fail_fast)
+
+        # In fail fast mode, remaining paths are not even read from file.
+        if fail_fast and failures > 0:
+            break
 
     # Return errors count for this particular check.
     return failures
 
 
-def check_openapi_json(verbose, directory):
+def check_openapi_json(verbose: Optional[bool], directory: str,
+                       fail_fast: Optional[bool]) -> Tuple[int, int]:
     """Check the content of OpenAPI JSON file."""
     # Reset counters with number of passes and number of failures.
     passes = 0
     failures = 0
 
-    filename = directory + "openapi.json"
-
-    # If the file can be opened and loaded as JSON, everything is fine.
-    with open(filename, 'r') as fin:
+    filename = os.path.join(directory, "openapi.json")
+
+    # The file might be missing (or unreadable) in some of checked
+    # directories. This is reported as a failure, so the other directories
+    # are still checked.
+    try:
+        fin = open(filename, 'rb')
+    except OSError as e:
+        print("{} can't be read".format(filename))
+        failures += 1
+        print(e)
+        return passes, failures
+
+    # In verbose mode, all problems are displayed immediately, together with
+    # information about checked nodes. Otherwise they are collected and
+    # written at once, to avoid issuing one write per problem found.
+    errors: List[str] = []
+    report = print if verbose is not None else errors.append
+
+    # If the file can be opened and parsed as JSON, everything is fine. The
+    # file is parsed incrementally, so the whole OpenAPI specification is
+    # never materialized in memory.
+    with fin:
         try:
-            # Try to load and parse the content of JSON file.
-            obj = load(fin)
+            # Check the syntax of the whole file and read its info node.
+            info = read_info_node(fin)
 
-            # At this point the JSON has been loaded and parsed correctly.
+            # At this point the JSON has been parsed correctly.
             if verbose is not None:
                 print("{} has valid JSON format".format(filename))
 
-            failures += check_info_node(obj, verbose)
-            failures += check_all_paths(obj, verbose)
+            failures += check_info_node(info, verbose, report)
+
+            # Rewind the file and stream all paths, one path at a time. In
+            # fail fast mode, paths are not checked when info node is wrong.
+            if not fail_fast or failures == 0:
+                paths = read_paths(fin)
+                failures += check_all_paths(paths, verbose, report, fail_fast)
 
             if failures == 0:
                 passes += 1
 
-        except ValueError as e:
+        except (ValueError, ijson.JSONError) as e:
             # There are several reasons and possibilities why the file can not
             # be read as JSON, so we just print the error message taken from
             # exception object.
@@ -248,12 +320,19 @@ def check_openapi_json(verbose, directory):
             failures += 1
             print(e)
 
+        finally:
+            # Display all collected problems, even when checking has been
+            # interrupted by unexpected exception (for example by malformed
+            # node).
+            if errors:
+                stdout.write("\n".join(errors) + "\n")
+
     # Just the counters need to be returned because all other informations
     # about problems have been displayed already.
     return passes, failures
 
 
-def display_report(passes, failures, nocolors):
+def display_report(passes: int, failures: int, nocolors: Optional[bool]) -> None:
     """Display report about number of passes and failures."""
     # First of all, we need to setup colors to be displayed on terminal. Colors
     # are displayed by using terminal escape control codes. When color output
@@ -262,7 +341,7 @@ def display_report(passes, failures, nocolors):
     red_background = green_background = magenta_background = no_color = ""
 
     # If colors are enabled by command line parameter, use control sequence
-    # returned by `tput` command.
+    # read from terminfo database.
     if not nocolors:
         red_background = read_control_code("setab 1")
         green_background = read_control_code("setab 2")
@@ -291,7 +370,7 @@ def display_report(passes, failures, nocolors):
     print("{} failures".format(failures))
 
 
-def main():
+def main() -> None:
     """Entry point to this tool."""
     # First of all, we need to specify all command line flags that are
     # recognized by this tool.
@@ -300,15 +379,32 @@ def main():
                         action="store_true", default=None)
     parser.add_argument("-n", "--no-colors", dest="nocolors", help="disable color output",
                         action="store_true", default=None)
-    parser.add_argument("-d", "--directory", dest="directory",
-                        help="directory OpenAPI JSON file to check",
-                        action="store", default="./")
+    parser.add_argument("-f", "--fail-fast", dest="fail_fast",
+                        help="stop checking after first problem is found",
+                        action="store_true", default=None)
+    parser.add_argument("-d", "--directory", dest="directory", nargs="+",
+                        help="directories with OpenAPI JSON file to check",
+                        action="store", default=["./"])
     # Now it is time to parse flags, check the actual content of command line
     # and fill in the object named `args`.
     args = parser.parse_args()
 
-    # Check JSON file containing OpenAPI specification.
-    passes, failures = check_openapi_json(args.verbose, args.directory)
+    # Reset counters with number of passes and number of failures.
+    passes = 0
+    failures = 0
+
+    # Check JSON files containing OpenAPI specification in all directories.
+    # Everything that does not depend on checked file (like terminal control
+    # codes) is set up just once for the whole batch.
+    for directory in args.directory:
+        file_passes, file_failures = check_openapi_json(args.verbose, directory,
+                                                        args.fail_fast)
+        passes += file_passes
+        failures += file_failures
+
+        # In fail fast mode, remaining files are not checked.
+        if args.fail_fast and failures > 0:
+            break
 
     # Display detailed report and summary as well.
     display_report(passes, failures, args.nocolors)